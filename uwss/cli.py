@@ -1,32 +1,82 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import hashlib
 import json
+import os
 import time
 
 from .config_loader import load_config
-from .logger import get_logger
-from .core.discovery import discover_openalex
-from .core.storage import DB
-from .core.fetching import fetch_one
-from .core.scoring import score_db
-from .core.exporter import export_rows
+from .logger import configure_logging, get_logger
+from .utils import jsonio
+
+# Các import nặng (requests, parser...) được để lazy trong từng command
+# để `uwss doctor` / `uwss config` khởi động nhanh.
 
 
 # ===== Helpers =====
 
 
+@functools.lru_cache(maxsize=4096)
 def _mk_id(title: str, year: int) -> str:
-    base = f"{(title or '').strip()}_{year or 0}"
-    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+    # blake2b nhanh hơn sha1 cho key tổng hợp (không cần crypto);
+    # cache vì discover hay gặp lại cùng (title, year) trong 1 run.
+    # Ghép bytes trực tiếp, tránh f-string + encode trung gian.
+    base = (title or "").strip().encode("utf-8") + b"_" + str(year or 0).encode("ascii")
+    return hashlib.blake2b(base, digest_size=20).hexdigest()
+
+
+def _project_meta(w: dict) -> dict:
+    """
+    Chỉ giữ các field OpenAlex mà pipeline thực sự dùng về sau:
+    - id/doi: detect nguồn + enrich Unpaywall (registry)
+    - best_oa_location/primary_location/locations/open_access: map Location (fetch)
+    - abstract_inverted_index: dựng abstract khi scoring
+    Bỏ phần còn lại (authorships, concepts, referenced_works...) để row nhỏ lại
+    đáng kể → ít page IO hơn khi quét DB.
+    """
+    return {
+        "id": w.get("id"),
+        "doi": w.get("doi"),
+        "open_access": w.get("open_access"),
+        "best_oa_location": w.get("best_oa_location"),
+        "primary_location": w.get("primary_location"),
+        "locations": w.get("locations"),
+        "abstract_inverted_index": w.get("abstract_inverted_index"),
+    }
+
+
+def _row_from_work(w: dict, rid: str, title: str, year: int) -> dict:
+    """Shape 1 work OpenAlex thành row DB — gom mọi .get() về một chỗ, mỗi field đọc đúng 1 lần."""
+    host = w.get("host_venue") or {}
+    primary = w.get("primary_location") or {}
+    return {
+        "id": rid,
+        "title": title,
+        "year": year,
+        "venue": host.get("display_name") or "",
+        "doi": w.get("doi") or "",
+        "source_url": primary.get("landing_page_url") or "",
+        "pdf_path": "",
+        "html_path": "",
+        "text_path": "",
+        "score": 0.0,
+        "kept": 0,
+        # lưu metadata đã rút gọn để dùng sau (fetch/unpaywall/sequence)
+        "meta_json": jsonio.dumps(_project_meta(w)),
+    }
 
 
 def _get_openalex_opts(cfg: dict) -> dict:
     """
     Lấy options cho nguồn openalex từ config.sources (kiểu plugin list).
     Hỗ trợ cả dạng legacy nếu bạn vẫn còn.
+    Kết quả được cache trên cfg để không phải parse lại mỗi lần gọi.
     """
+    cache = cfg.setdefault("_parsed_opts", {})
+    if "openalex" in cache:
+        return cache["openalex"]
     out = {
         "max_results": 50,
         "per_page": 25,
@@ -58,21 +108,28 @@ def _get_openalex_opts(cfg: dict) -> dict:
                 if "mailto" in opts:
                     out["mailto"] = opts.get("mailto")
                 break
+    cache["openalex"] = out
     return out
 
 
 def _get_unpaywall_opts(cfg: dict) -> dict:
+    cache = cfg.setdefault("_parsed_opts", {})
+    if "unpaywall" in cache:
+        return cache["unpaywall"]
+    out = {"email": None, "timeout": 20, "prefer_best": True}
     srcs = cfg.get("sources", [])
     if isinstance(srcs, list):
         for s in srcs:
             if s.get("plugin") == "unpaywall" or s.get("name") == "unpaywall":
                 opts = s.get("options", {}) or {}
-                return {
+                out = {
                     "email": opts.get("email"),
                     "timeout": int(opts.get("timeout", 20)),
                     "prefer_best": bool(opts.get("prefer_best", True)),
                 }
-    return {"email": None, "timeout": 20, "prefer_best": True}
+                break
+    cache["unpaywall"] = out
+    return out
 
 
 # ===== Commands =====
@@ -95,6 +152,8 @@ def cmd_config(cfg: dict, show: bool):
 
 
 def cmd_db_init(cfg: dict):
+    from .core.storage import DB
+
     db = DB(cfg["storage"]["database"])
     # chèn 1 record mẫu để xác nhận schema/ghi chép hoạt động
     sample = {
@@ -109,26 +168,25 @@ def cmd_db_init(cfg: dict):
         "text_path": "",
         "score": 0.0,
         "kept": 0,
-        "meta_json": json.dumps({"note": "init row"}, ensure_ascii=False),
+        "meta_json": jsonio.dumps({"note": "init row"}),
     }
     db.upsert_item(sample)
+    db.flush()  # upsert_item không tự commit nữa
     print("DB initialized and sample row inserted.")
 
 
 def cmd_db_peek(cfg: dict, limit: int = 3):
+    from .core.storage import DB
+
     db = DB(cfg["storage"]["database"])
-    for i, row in enumerate(db.iter_items()):
-        if i >= limit:
-            break
-        print(
-            json.dumps(
-                {k: row[k] for k in ("id", "title", "year", "doi", "score", "kept")},
-                ensure_ascii=False,
-            )
-        )
+    for row in db.peek(limit):
+        print(jsonio.dumps(row))
 
 
 def cmd_discover(cfg: dict):
+    from .core.discovery import discover_openalex
+    from .core.storage import DB
+
     log = get_logger("uwss.discover", cfg["runtime"]["log_level"])
     kw = cfg["domain"]["keywords"]
     oa_opts = _get_openalex_opts(cfg)
@@ -145,6 +203,12 @@ def cmd_discover(cfg: dict):
 
     db = DB(cfg["storage"]["database"])
     count = 0
+    skipped = 0
+    # id đã có trong DB: skip sớm để khỏi tốn JSON encode + upsert khi re-run
+    known = db.known_ids()
+    # gom row vào buffer rồi upsert theo batch (1 transaction) thay vì từng row
+    batch_size = 1000
+    buf: list = []
 
     for w in discover_openalex(
         kw,
@@ -155,78 +219,68 @@ def cmd_discover(cfg: dict):
         min_year=oa_opts["min_year"],
         mailto=oa_opts["mailto"],
     ):
-        host = w.get("host_venue") or {}
-        primary = w.get("primary_location") or {}
-        row = {
-            "id": w.get("id")
-            or _mk_id(w.get("title") or "", w.get("publication_year") or 0),
-            "title": (w.get("title") or "").strip(),
-            "year": w.get("publication_year") or 0,
-            "venue": host.get("display_name") or "",
-            "doi": w.get("doi") or "",
-            "source_url": primary.get("landing_page_url") or "",
-            "pdf_path": "",
-            "html_path": "",
-            "text_path": "",
-            "score": 0.0,
-            "kept": 0,
-            # lưu raw metadata để dùng sau (fetch/unpaywall/sequence)
-            "meta_json": json.dumps(w, ensure_ascii=False),
-        }
-        db.upsert_item(row)
+        # title/year đọc 1 lần, dùng chung cho _mk_id lẫn row
+        title = (w.get("title") or "").strip()
+        year = w.get("publication_year") or 0
+        rid = w.get("id") or _mk_id(title, year)
+        if rid in known:
+            skipped += 1
+            continue
+        known.add(rid)
+        buf.append(_row_from_work(w, rid, title, year))
         count += 1
+        if len(buf) >= batch_size:
+            db.upsert_many(buf)
+            buf.clear()
+
+    if buf:
+        db.upsert_many(buf)
 
-    log.info("discovered %d records into DB %s", count, cfg["storage"]["database"])
+    log.info(
+        "discovered %d records (%d already known) into DB %s",
+        count,
+        skipped,
+        cfg["storage"]["database"],
+    )
 
 
 def cmd_fetch(cfg: dict, limit: int = 20):
+    from .core.fetching import fetch_many
+    from .core.storage import DB
+
     log = get_logger("uwss.fetch", cfg["runtime"]["log_level"])
     db = DB(cfg["storage"]["database"])
     ua = cfg["runtime"]["user_agent"]
     raw_dir = cfg["storage"]["raw_dir"]
+    # tạo thư mục đích 1 lần cho cả run — _download không stat/mkdir per file nữa
+    os.makedirs(raw_dir, exist_ok=True)
     verify_ssl = cfg.get("runtime", {}).get("ssl_verify", True)
 
     upw = _get_unpaywall_opts(cfg)
+    workers = max(1, int(cfg.get("runtime", {}).get("max_concurrent", 4)))
 
-    done = 0
-    pdfs = htmls = none = 0
+    # các row chưa có file — lọc ngay trong SQL, rồi fetch song song (thuần I/O)
+    todo = list(db.iter_needing_fetch(limit))
 
-    for row in db.iter_items():
-        if done >= limit:
-            break
-        # chỉ fetch những bản chưa có file
-        if (row.get("pdf_path") or "").strip() or (row.get("html_path") or "").strip():
-            continue
-        new_row = fetch_one(
-            db,
-            row,
-            raw_dir=raw_dir,
-            ua=ua,
-            verify_ssl=verify_ssl,
-            unpaywall_email=upw.get("email"),
-            unpaywall_timeout=upw.get("timeout", 20),
-            unpaywall_prefer_best=upw.get("prefer_best", True),
-        )
-        got = (
-            "pdf"
-            if (new_row.get("pdf_path") or "").strip()
-            else ("html" if (new_row.get("html_path") or "").strip() else "none")
-        )
-        if got == "pdf":
-            pdfs += 1
-        elif got == "html":
-            htmls += 1
-        else:
-            none += 1
-        log.info("fetched %s → %s", row["id"], got)
-        done += 1
+    stats = fetch_many(
+        db,
+        todo,
+        raw_dir=raw_dir,
+        ua=ua,
+        max_workers=workers,
+        verify_ssl=verify_ssl,
+        unpaywall_email=upw.get("email"),
+        unpaywall_timeout=upw.get("timeout", 20),
+        unpaywall_prefer_best=upw.get("prefer_best", True),
+        log=log,
+    )
 
     log.info(
         "fetch finished: %d attempted | pdf=%d html=%d none=%d",
-        done,
-        pdfs,
-        htmls,
-        none,
+        stats["attempted"],
+        stats["pdf"],
+        stats["html"],
+        stats["none"],
     )
 
 
@@ -235,6 +289,8 @@ def cmd_extract(cfg: dict, limit: int = 50):
     Gọi các hàm extract trong uwss.core.parsing một cách linh hoạt để không phá code hiện tại của bạn.
     Ưu tiên các batch API nếu có; nếu không, fallback sang vòng lặp từng row.
     """
+    from .core.storage import DB
+
     log = get_logger("uwss.extract", cfg["runtime"]["log_level"])
     db = DB(cfg["storage"]["database"])
     text_dir = cfg["storage"]["text_dir"]
@@ -288,14 +344,8 @@ def cmd_extract(cfg: dict, limit: int = 50):
 
     # Fallback: xử lý từng row nếu có single_fn
     if single_fn is not None:
-        for row in db.iter_items():
-            if limit and attempted >= limit:
-                break
-            # chỉ extract nếu có file gốc nhưng chưa có text
-            has_src = (row.get("pdf_path") or row.get("html_path") or "").strip()
-            has_txt = (row.get("text_path") or "").strip()
-            if not has_src or has_txt:
-                continue
+        # chỉ lấy row có file gốc nhưng chưa có text — filter trong SQL
+        for row in db.iter_needing_extract(limit):
             attempted += 1
             try:
                 new_row = single_fn(db, row, out_dir=text_dir)  # type: ignore
@@ -311,6 +361,7 @@ def cmd_extract(cfg: dict, limit: int = 50):
                     pass
             except Exception:
                 pass
+        db.flush()
         log.info("extract finished: attempted=%d ok=%d", attempted, ok)
         return
 
@@ -322,6 +373,9 @@ def cmd_extract(cfg: dict, limit: int = 50):
 
 
 def cmd_score(cfg: dict):
+    from .core.scoring import score_db
+    from .core.storage import DB
+
     log_level = cfg["runtime"]["log_level"]
     db = DB(cfg["storage"]["database"])
     stats = score_db(db, cfg, log_level=log_level)
@@ -336,6 +390,9 @@ def cmd_export(
     only_kept: bool = False,
     only_with_files: bool = False,
 ):
+    from .core.exporter import export_rows
+    from .core.storage import DB
+
     db = DB(cfg["storage"]["database"])
     out_dir = cfg["storage"]["out_dir"]
     log_level = cfg["runtime"]["log_level"]
@@ -351,53 +408,37 @@ def cmd_export(
 
 
 def cmd_db_stats(cfg: dict):
+    from .core.storage import DB
+
     db = DB(cfg["storage"]["database"])
-    total = pdf = html = text = kept = 0
-    for row in db.iter_items():
-        total += 1
-        if (row.get("pdf_path") or "").strip():
-            pdf += 1
-        if (row.get("html_path") or "").strip():
-            html += 1
-        if (row.get("text_path") or "").strip():
-            text += 1
-        if int(row.get("kept") or 0) == 1:
-            kept += 1
-    print(
-        json.dumps(
-            {
-                "total": total,
-                "with_pdf": pdf,
-                "with_html": html,
-                "with_text": text,
-                "kept": kept,
-            },
-            ensure_ascii=False,
-            indent=2,
-        )
-    )
+    print(json.dumps(db.stats(), ensure_ascii=False, indent=2))
 
 
 # ===== main =====
 
+# dispatch theo dict: 1 lần hash lookup thay cho chuỗi if/elif
+DISPATCH = {
+    "doctor": lambda args, cfg: cmd_doctor(cfg),
+    "config": lambda args, cfg: cmd_config(cfg, args.show),
+    "db-init": lambda args, cfg: cmd_db_init(cfg),
+    "db-peek": lambda args, cfg: cmd_db_peek(cfg, args.limit),
+    "discover": lambda args, cfg: cmd_discover(cfg),
+    "fetch": lambda args, cfg: cmd_fetch(cfg, args.limit),
+    "extract": lambda args, cfg: cmd_extract(cfg, args.limit),
+    "score": lambda args, cfg: cmd_score(cfg),
+    "export": lambda args, cfg: cmd_export(
+        cfg,
+        fmt=args.fmt,
+        only_kept=args.only_kept,
+        only_with_files=args.only_with_files,
+    ),
+    "db-stats": lambda args, cfg: cmd_db_stats(cfg),
+}
+
 
 def main():
     ap = argparse.ArgumentParser(prog="uwss", description="UWSS CLI")
-    ap.add_argument(
-        "cmd",
-        choices=[
-            "doctor",
-            "config",
-            "db-init",
-            "db-peek",
-            "discover",
-            "fetch",
-            "extract",
-            "score",
-            "export",
-            "db-stats",
-        ],
-    )
+    ap.add_argument("cmd", choices=list(DISPATCH))
     ap.add_argument("--config", default="config/default.yaml")
     ap.add_argument("--show", action="store_true", help="print config (with 'config')")
     ap.add_argument("--limit", type=int, default=50, help="item limit for some cmds")
@@ -420,32 +461,9 @@ def main():
 
     args = ap.parse_args()
     cfg = load_config(args.config)
+    configure_logging()
 
-    if args.cmd == "doctor":
-        cmd_doctor(cfg)
-    elif args.cmd == "config":
-        cmd_config(cfg, args.show)
-    elif args.cmd == "db-init":
-        cmd_db_init(cfg)
-    elif args.cmd == "db-peek":
-        cmd_db_peek(cfg, args.limit)
-    elif args.cmd == "discover":
-        cmd_discover(cfg)
-    elif args.cmd == "fetch":
-        cmd_fetch(cfg, args.limit)
-    elif args.cmd == "extract":
-        cmd_extract(cfg, args.limit)
-    elif args.cmd == "score":
-        cmd_score(cfg)
-    elif args.cmd == "export":
-        cmd_export(
-            cfg,
-            fmt=args.fmt,
-            only_kept=args.only_kept,
-            only_with_files=args.only_with_files,
-        )
-    elif args.cmd == "db-stats":
-        cmd_db_stats(cfg)
+    DISPATCH[args.cmd](args, cfg)
 
 
 if __name__ == "__main__":
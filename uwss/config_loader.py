@@ -1,7 +1,14 @@
 from __future__ import annotations
+import glob
+import hashlib
 import os
 import yaml
 
+from .utils import jsonio
+
+# loader C (libyaml) nếu build có — nhanh hơn SafeLoader thuần Python nhiều lần
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 _DEFAULTS = {
     "domain": {"keywords": [], "boost": []},
     "sources": {"openalex": {"enabled": True, "max_results": 10}},
@@ -19,6 +26,16 @@ _DEFAULTS = {
     },
 }
 
+# cache config đã parse ra JSON (parse nhanh hơn YAML nhiều lần);
+# key theo mtime_ns nên tự invalidate khi file YAML đổi
+_CACHE_DIR = "data/logs"
+
+# fingerprint của _DEFAULTS cũng nằm trong tên cache: cache chứa config
+# ĐÃ merge defaults, nên code mới đổi defaults là cache cũ phải tự miss
+_DEFAULTS_SIG = hashlib.blake2b(
+    repr(_DEFAULTS).encode("utf-8"), digest_size=4
+).hexdigest()
+
 
 def _deep_merge(a: dict, b: dict) -> dict:
     """merge b into a (shallow-safe for our small config)"""
@@ -31,11 +48,7 @@ def _deep_merge(a: dict, b: dict) -> dict:
     return out
 
 
-def load_config(path: str) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        user_cfg = yaml.safe_load(f) or {}
-    cfg = _deep_merge(_DEFAULTS, user_cfg)
-
+def _ensure_dirs(cfg: dict) -> None:
     # đảm bảo các thư mục lưu trữ tồn tại
     for p in [
         cfg["storage"]["raw_dir"],
@@ -44,4 +57,52 @@ def load_config(path: str) -> dict:
         "data/logs",
     ]:
         os.makedirs(p, exist_ok=True)
+
+
+def _cache_path(path: str) -> str | None:
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    key = hashlib.blake2b(os.path.abspath(path).encode("utf-8"), digest_size=8)
+    return os.path.join(
+        _CACHE_DIR, f".cfg_{key.hexdigest()}_{_DEFAULTS_SIG}_{mtime_ns}.json"
+    )
+
+
+def load_config(path: str) -> dict:
+    cache = _cache_path(path)
+    if cache and os.path.exists(cache):
+        try:
+            with open(cache, "rb") as f:
+                cfg = jsonio.loads(f.read())
+            _ensure_dirs(cfg)
+            return cfg
+        except (OSError, ValueError):
+            pass  # cache hỏng thì parse lại YAML
+
+    with open(path, "r", encoding="utf-8") as f:
+        user_cfg = yaml.load(f, Loader=_Loader) or {}
+    cfg = _deep_merge(_DEFAULTS, user_cfg)
+    _ensure_dirs(cfg)
+
+    if cache:
+        try:
+            # TypeError: YAML cho ra kiểu không phải JSON (vd date) — stdlib
+            # dumps sẽ raise; orjson thì đổi kiểu (date -> str) nên check
+            # round-trip: không khớp thì thôi không cache, trả cfg gốc
+            blob = jsonio.dumps_bytes(cfg)
+            if jsonio.loads(blob) != cfg:
+                return cfg
+            # dọn cache cũ của cùng file (mtime/defaults khác) rồi ghi atomic
+            prefix = cache.rsplit("_", 2)[0]
+            for old in glob.glob(prefix + "_*.json"):
+                if old != cache:
+                    os.remove(old)
+            tmp = cache + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, cache)
+        except (OSError, TypeError):
+            pass
     return cfg
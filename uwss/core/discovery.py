@@ -1,6 +1,7 @@
 # uwss/core/discovery.py
 from __future__ import annotations
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, List, Optional
 import requests
 import certifi
@@ -75,31 +76,53 @@ def discover_openalex(
     fetched = 0
     verify_param = certifi.where()
 
-    while fetched < max_results and params.get("cursor"):
-        try:
-            resp = session.get(
-                BASE, params=params, timeout=timeout, verify=verify_param
-            )
-            if resp.status_code != 200:
+    # pacing theo deadline trong worker thread: caller không bao giờ bị block
+    # bởi sleep lịch sự giữa các trang
+    next_allowed = 0.0
+
+    def _get_page(p: dict):
+        nonlocal next_allowed
+        wait = next_allowed - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        next_allowed = time.monotonic() + request_delay_s
+        return session.get(BASE, params=p, timeout=timeout, verify=verify_param)
+
+    # prefetch: trang kế tiếp được tải trên background thread trong lúc
+    # caller đang xử lý (vd: upsert DB) trang hiện tại
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(_get_page, dict(params))
+        while fetched < max_results and future is not None:
+            try:
+                resp = future.result()
+                if resp.status_code != 200:
+                    time.sleep(request_delay_s)
+                    break
+                data = resp.json()
+            except requests.RequestException:
+                time.sleep(request_delay_s)
+                break
+            except ValueError:
                 time.sleep(request_delay_s)
                 break
-            data = resp.json()
-        except requests.RequestException:
-            time.sleep(request_delay_s)
-            break
-        except ValueError:
-            time.sleep(request_delay_s)
-            break
-
-        results = data.get("results") or []
-        if not results:
-            break
-
-        for w in results:
-            yield w
-            fetched += 1
-            if fetched >= max_results:
+
+            results = data.get("results") or []
+            if not results:
                 break
 
-        params["cursor"] = data.get("meta", {}).get("next_cursor")
-        time.sleep(request_delay_s)
+            # submit trang sau NGAY trước khi yield để overlap mạng với DB
+            next_cursor = data.get("meta", {}).get("next_cursor")
+            if next_cursor and fetched + len(results) < max_results:
+                params["cursor"] = next_cursor
+                future = executor.submit(_get_page, dict(params))
+            else:
+                future = None
+
+            for w in results:
+                yield w
+                fetched += 1
+                if fetched >= max_results:
+                    break
+    finally:
+        executor.shutdown(wait=False)
@@ -1,68 +1,70 @@
 from __future__ import annotations
 
 import csv
-import json
 import os
-from datetime import datetime
-from typing import Dict, Any, List
+import time
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, Any, Iterator, List
 
 from ..logger import get_logger
+from ..utils import jsonio
+
+
+class _RowDefaults(dict):
+    """dict trả '' cho key thiếu — để itemgetter (C-level) không raise."""
+
+    def __missing__(self, key):
+        return ""
 
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
+_STAMP_FMT = "%Y%m%d_%H%M%S"
+
+
 def _now_stamp() -> str:
-    # UTC-based timestamp để tên file ổn định, không chứa ký tự đặc biệt
-    return datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    # UTC-based timestamp để tên file ổn định, không chứa ký tự đặc biệt;
+    # time.strftime tránh phải dựng object datetime
+    return time.strftime(_STAMP_FMT, time.gmtime())
+
+
+# bộ cột chuẩn của schema items — dùng luôn khi row đầu khớp đủ
+_PREFERRED_FIELDS = [
+    "id",
+    "title",
+    "year",
+    "doi",
+    "venue",
+    "source_url",
+    "pdf_path",
+    "html_path",
+    "text_path",
+    "score",
+    "kept",
+]
 
 
 def _choose_fields(rows: List[Dict[str, Any]]) -> List[str]:
     """
-    Chọn tập cột hợp lý để xuất. Nếu DB có schema ổn định thì trả về bộ cột chuẩn.
+    Chọn tập cột để xuất. Happy path (schema ổn định): row đầu tiên chứa đủ
+    bộ cột chuẩn → trả hằng số ngay, không quét phần còn lại.
     Nếu không, hợp nhất keys từ các dòng (tránh lỗi missing).
     """
     if not rows:
-        # fallback bộ cột tối thiểu
-        return [
-            "id",
-            "title",
-            "year",
-            "doi",
-            "venue",
-            "source_url",
-            "pdf_path",
-            "html_path",
-            "text_path",
-            "score",
-            "kept",
-        ]
-
-    # Ưu tiên bộ cột chuẩn nếu có đủ
-    preferred = [
-        "id",
-        "title",
-        "year",
-        "doi",
-        "venue",
-        "source_url",
-        "pdf_path",
-        "html_path",
-        "text_path",
-        "score",
-        "kept",
-    ]
-    row_keys = set()
-    for r in rows:
-        row_keys.update(list(r.keys()))
+        return _PREFERRED_FIELDS
 
-    if all(k in row_keys for k in preferred):
-        return preferred
+    first_keys = rows[0].keys()
+    if all(k in first_keys for k in _PREFERRED_FIELDS):
+        return _PREFERRED_FIELDS
 
-    # Nếu thiếu, hợp nhất keys sẵn có theo thứ tự ổn định
-    merged = sorted(row_keys)
-    return merged
+    # schema lạ: hợp nhất keys sẵn có theo thứ tự ổn định
+    row_keys = set()
+    for r in rows:
+        row_keys.update(r.keys())
+    return sorted(row_keys)
 
 
 def export_rows(
@@ -81,40 +83,50 @@ def export_rows(
     """
     log = get_logger("uwss.export", log_level)
 
-    rows: List[Dict[str, Any]] = []
-    for row in db.iter_items():
-        if only_kept and int(row.get("kept") or 0) != 1:
-            continue
-        if only_with_files:
-            has_pdf = bool((row.get("pdf_path") or "").strip())
-            has_html = bool((row.get("html_path") or "").strip())
-            if not (has_pdf or has_html):
-                continue
-        rows.append(row)
-
     _ensure_dir(out_dir)
     stamp = _now_stamp()
+    # stream từng row; filter kept/with-files chạy trong SQL
+    rows_iter: Iterator[Dict[str, Any]] = db.iter_export_rows(
+        only_kept=only_kept, only_with_files=only_with_files
+    )
+    n = 0
 
     if fmt.lower() == "jsonl":
         out_path = os.path.join(out_dir, f"uwss_export_{stamp}.jsonl")
-        with open(out_path, "w", encoding="utf-8") as fo:
-            for r in rows:
-                fo.write(json.dumps(r, ensure_ascii=False) + "\n")
-        log.info("exported %d rows -> %s", len(rows), out_path)
+        # ghi bytes thẳng (orjson nếu có) — khỏi encode str→bytes mỗi dòng
+        with open(out_path, "wb", buffering=1 << 20) as fo:
+            for r in rows_iter:
+                fo.write(jsonio.dumps_bytes(r) + b"\n")
+                n += 1
+        log.info("exported %d rows -> %s", n, out_path)
         return out_path
 
     # Mặc định CSV
     out_path = os.path.join(out_dir, f"uwss_export_{stamp}.csv")
-    fields = _choose_fields(rows)
 
-    # Ghi CSV với UTF-8 BOM để mở bằng Excel thân thiện
+    # chọn cột từ row đầu tiên rồi ghi tiếp phần còn lại của stream
+    first = next(rows_iter, None)
+    fields = _choose_fields([first] if first is not None else [])
+    if first is not None:
+        rows_iter = chain([first], rows_iter)
+
+    # Ghi CSV với UTF-8 BOM để mở bằng Excel thân thiện.
+    # csv.writer + list giá trị: bỏ chi phí build dict per-row của DictWriter
     with open(out_path, "w", encoding="utf-8-sig", newline="") as fo:
-        writer = csv.DictWriter(fo, fieldnames=fields, extrasaction="ignore")
-        writer.writeheader()
-        for r in rows:
-            # đảm bảo các field thiếu không gây lỗi
-            safe = {k: r.get(k, "") for k in fields}
-            writer.writerow(safe)
-
-    log.info("exported %d rows -> %s", len(rows), out_path)
+        writer = csv.writer(fo)
+        writer.writerow(fields)
+
+        # itemgetter chạy vòng lặp field trong C thay vì r.get() per field
+        getter = itemgetter(*fields)
+
+        def _rows_as_tuples():
+            nonlocal n
+            for r in rows_iter:
+                n += 1
+                vals = getter(_RowDefaults(r))
+                yield vals if len(fields) > 1 else (vals,)
+
+        writer.writerows(_rows_as_tuples())
+
+    log.info("exported %d rows -> %s", n, out_path)
     return out_path
@@ -1,10 +1,12 @@
 # uwss/core/fetching.py
 from __future__ import annotations
 import os
-import json
+import threading
 import time
 import re
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional, List
+from urllib.parse import urlsplit
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -12,18 +14,39 @@ from urllib3.util import Retry
 import certifi
 
 from .storage import DB
+from ..utils import jsonio
 from uwss.schemas.location import Location
 from uwss.registry import locations_from_meta, enrich_locations_with_unpaywall
 
-SAFE_CHARS = re.compile(r"[^a-zA-Z0-9._-]+")
+SAFE_CHARS = re.compile(r"[^a-zA-Z0-9._-]+", re.ASCII)
+
+# cap số download đồng thời trên cùng 1 host — lịch sự với publisher
+# kể cả khi thread pool lớn
+_PER_HOST_LIMIT = 4
+_host_sems: Dict[str, threading.BoundedSemaphore] = {}
+_host_sems_lock = threading.Lock()
+
+
+def _host_sem(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    with _host_sems_lock:
+        sem = _host_sems.get(host)
+        if sem is None:
+            sem = _host_sems[host] = threading.BoundedSemaphore(_PER_HOST_LIMIT)
+    return sem
 
 
 def _safe_name(s: str) -> str:
     s = s.strip().replace("https://openalex.org/", "")
+    # fast path: work id OpenAlex (W123...) đã sạch sẵn — khỏi chạy regex
+    if s[:1] == "W" and s[1:].isdigit():
+        return s[:128]
     return SAFE_CHARS.sub("_", s)[:128] or f"item_{int(time.time())}"
 
 
-def _make_session(ua: str, retries: int = 3, backoff: float = 0.5) -> requests.Session:
+def _make_session(
+    ua: str, retries: int = 3, backoff: float = 0.5, pool_size: int = 10
+) -> requests.Session:
     s = requests.Session()
     s.headers.update({"User-Agent": ua, "Accept": "*/*"})
     retry = Retry(
@@ -35,53 +58,44 @@ def _make_session(ua: str, retries: int = 3, backoff: float = 0.5) -> requests.S
         allowed_methods=["GET", "HEAD"],
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # pool_size theo số worker để connection các host luôn warm khi fetch song song
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
     s.mount("https://", adapter)
     s.mount("http://", adapter)
     return s
 
 
-def _is_real_pdf(path: str) -> bool:
-    try:
-        with open(path, "rb") as f:
-            return f.read(4) == b"%PDF"
-    except OSError:
-        return False
-
-
-def _head_content_type(
-    sess: requests.Session, url: str, timeout: int, verify_ssl: bool
-) -> str:
-    try:
-        r = sess.head(
-            url,
-            timeout=timeout,
-            allow_redirects=True,
-            verify=(certifi.where() if verify_ssl else False),
-        )
-        return (r.headers.get("Content-Type") or "").lower()
-    except requests.RequestException:
-        return ""
-
-
 def _download(
     sess: requests.Session,
     url: str,
     out_path: str,
     timeout: int = 30,
     verify_ssl: bool = True,
+    require_pdf: bool = False,
 ) -> bool:
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # caller chịu trách nhiệm tạo thư mục đích (1 lần/run) — xem cmd_fetch
     verify_param = certifi.where() if verify_ssl else False
     try:
-        with sess.get(
+        with _host_sem(url), sess.get(
             url, timeout=timeout, stream=True, verify=verify_param, allow_redirects=True
         ) as r:
             if r.status_code != 200:
                 return False
+            # 256 KiB/chunk: bớt ~32x số vòng lặp Python per file so với 8 KiB
+            chunks = r.iter_content(262144)
+            first = next(chunks, b"")
+            # sniff magic bytes ngay trên stream: khỏi cần HEAD trước đó,
+            # và không tải cả body nếu URL "pdf" thực ra là trang HTML
+            if require_pdf and not first.startswith(b"%PDF"):
+                return False
             total = 0
             with open(out_path, "wb") as f:
-                for chunk in r.iter_content(8192):
+                if first:
+                    f.write(first)
+                    total = len(first)
+                for chunk in chunks:
                     if not chunk:
                         continue
                     f.write(chunk)
@@ -97,20 +111,17 @@ def _try_pdf(
     if not loc.pdf_url:
         return None
     pdf_path = f"{base_path}.pdf"
-    ctype = _head_content_type(
-        sess, loc.pdf_url, timeout=timeout, verify_ssl=verify_ssl
-    )
-    is_pdf_like = ("application/pdf" in ctype) if ctype else True
-    if is_pdf_like and _download(
-        sess, loc.pdf_url, pdf_path, timeout=timeout, verify_ssl=verify_ssl
+    # require_pdf: _download sniff %PDF trên chunk đầu và bỏ trước khi ghi,
+    # nên không cần mở lại file kiểm tra / dọn rác nữa
+    if _download(
+        sess,
+        loc.pdf_url,
+        pdf_path,
+        timeout=timeout,
+        verify_ssl=verify_ssl,
+        require_pdf=True,
     ):
-        if _is_real_pdf(pdf_path):
-            return pdf_path
-        try:
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
-        except OSError:
-            pass
+        return pdf_path
     return None
 
 
@@ -135,17 +146,19 @@ def fetch_one(
     unpaywall_email: Optional[str] = None,
     unpaywall_timeout: int = 20,
     unpaywall_prefer_best: bool = True,
+    session: Optional[requests.Session] = None,
 ) -> dict:
     """
     Universal fetch:
     - Map meta nguồn → List[Location] (OpenAlex, v.v.)
     - Enrich bằng Unpaywall nếu có DOI + email
     - Ưu tiên PDF, fallback HTML
+    - session: truyền Session dùng chung để giữ keep-alive giữa các item
+
+    LƯU Ý: không tự commit — fetch_many flush cuối đợt; gọi lẻ thì
+    caller phải db.flush() để ghi xuống đĩa.
     """
-    try:
-        meta = json.loads(item.get("meta_json") or "{}")
-    except Exception:
-        meta = {}
+    meta = jsonio.loads_meta(item.get("meta_json") or "")  # read-only, có cache
 
     locs: List[Location] = locations_from_meta(meta)
 
@@ -162,13 +175,20 @@ def fetch_one(
     safe_id = _safe_name(item["id"])
     base_path = os.path.join(raw_dir, safe_id)
     updated = dict(item)
-    sess = _make_session(ua)
+    sess = session if session is not None else _make_session(ua)
 
     got_pdf = False
     got_html = False
+    # URL đã thử, tách theo mode: URL trượt sniff %PDF ở vòng 1 thường chính
+    # là trang HTML (pdf_url == landing page) — vòng 2 vẫn phải được thử lại
+    tried_pdf: set = set()
+    tried_html: set = set()
 
     # Vòng 1: PDF
     for loc in locs:
+        if not loc.pdf_url or loc.pdf_url in tried_pdf:
+            continue
+        tried_pdf.add(loc.pdf_url)
         p = _try_pdf(sess, loc, base_path, timeout=timeout, verify_ssl=verify_ssl)
         if p:
             updated["pdf_path"] = p
@@ -178,6 +198,9 @@ def fetch_one(
     # Vòng 2: HTML
     if not got_pdf:
         for loc in locs:
+            if not loc.html_url or loc.html_url in tried_html:
+                continue
+            tried_html.add(loc.html_url)
             h = _try_html(sess, loc, base_path, timeout=timeout, verify_ssl=verify_ssl)
             if h:
                 updated["html_path"] = h
@@ -187,3 +210,68 @@ def fetch_one(
     if got_pdf or got_html:
         db.upsert_item(updated)
     return updated
+
+
+def fetch_many(
+    db: DB,
+    items: List[dict],
+    raw_dir: str,
+    ua: str,
+    max_workers: int = 8,
+    verify_ssl: bool = True,
+    timeout: int = 30,
+    unpaywall_email: Optional[str] = None,
+    unpaywall_timeout: int = 20,
+    unpaywall_prefer_best: bool = True,
+    log=None,
+) -> Dict[str, int]:
+    """
+    Fetch song song 1 danh sách item qua thread pool (fetch_one thuần I/O).
+    - Session dùng chung (keep-alive) cho cả đợt
+    - _download tự giới hạn concurrency per-host qua semaphore
+    Trả về thống kê {"attempted", "pdf", "html", "none"}.
+    """
+    stats = {"attempted": 0, "pdf": 0, "html": 0, "none": 0}
+    if not items:
+        return stats
+
+    max_workers = max(1, int(max_workers))
+    session = _make_session(ua, pool_size=max(16, max_workers * 2))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {
+            ex.submit(
+                fetch_one,
+                db,
+                item,
+                raw_dir=raw_dir,
+                ua=ua,
+                verify_ssl=verify_ssl,
+                timeout=timeout,
+                unpaywall_email=unpaywall_email,
+                unpaywall_timeout=unpaywall_timeout,
+                unpaywall_prefer_best=unpaywall_prefer_best,
+                session=session,
+            ): item["id"]
+            for item in items
+        }
+        for fut in as_completed(futures):
+            item_id = futures[fut]
+            stats["attempted"] += 1
+            try:
+                new_row = fut.result()
+            except Exception as e:
+                if log:
+                    log.warning("fetch failed %s: %s", item_id, e)
+                stats["none"] += 1
+                continue
+            got = (
+                "pdf"
+                if (new_row.get("pdf_path") or "").strip()
+                else ("html" if (new_row.get("html_path") or "").strip() else "none")
+            )
+            stats[got] += 1
+            if log:
+                log.info("fetched %s → %s", item_id, got)
+    db.flush()
+    return stats
@@ -1,48 +1,53 @@
 # uwss/core/parsing.py
 from __future__ import annotations
 import os
-import json
 import time
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from typing import Optional
 
 import fitz  # PyMuPDF
 import trafilatura
 
+from ..utils import jsonio
 from .storage import DB
 
-SAFE_CHARS = re.compile(r"[^a-zA-Z0-9._-]+")
+SAFE_CHARS = re.compile(r"[^a-zA-Z0-9._-]+", re.ASCII)
 
 
 def _safe_name(s: str) -> str:
     s = (s or "").strip().replace("https://openalex.org/", "")
+    # fast path: work id OpenAlex (W123...) đã sạch sẵn — khỏi chạy regex
+    if s[:1] == "W" and s[1:].isdigit():
+        return s[:128]
     return SAFE_CHARS.sub("_", s)[:128] or f"item_{int(time.time())}"
 
 
 def _extract_text_from_pdf(pdf_path: str, max_pages: Optional[int] = None) -> str:
     """Trích text từ PDF bằng PyMuPDF, ổn trên Windows. max_pages=None => toàn bộ."""
-    if not os.path.exists(pdf_path):
+    # không os.path.exists trước (thừa 1 stat + TOCTOU) — fitz.open tự báo lỗi
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception:
         return ""
     text_parts = []
-    with fitz.open(pdf_path) as doc:
-        n = len(doc)
-        end = n if max_pages is None else min(max_pages, n)
-        for i in range(end):
-            try:
-                page = doc.load_page(i)
+    with doc:
+        # iterate document trực tiếp (islice cắt theo page budget) thay vì
+        # load_page(i) từng trang; get_text hiếm khi raise nên 1 try bao cả loop
+        try:
+            for page in islice(doc, max_pages):
                 txt = page.get_text("text")
                 if txt:
                     text_parts.append(txt)
-            except Exception:
-                # tiếp tục trang sau nếu trang này lỗi
-                continue
+        except Exception:
+            pass  # giữ những trang đã lấy được
     return "\n".join(text_parts).strip()
 
 
 def _extract_text_from_html(html_path: str) -> str:
     """Trích text sạch từ HTML với trafilatura (khử boilerplate)."""
-    if not os.path.exists(html_path):
-        return ""
     try:
         with open(html_path, "rb") as f:
             raw = f.read()
@@ -52,15 +57,14 @@ def _extract_text_from_html(html_path: str) -> str:
         return ""
 
 
-def extract_one(
-    db: DB, item: dict, text_dir: str, max_pdf_pages: Optional[int] = None
+def _extract_row(
+    item: dict, text_dir: str, max_pdf_pages: Optional[int] = None
 ) -> dict:
     """
-    Với 1 record trong DB:
+    Extract thuần cho 1 row (không đụng DB) — chạy được trong process con:
       - nếu có pdf_path -> extract pdf
       - else nếu có html_path -> extract html
-      - lưu vào data/text/<safe_id>.txt
-      - cập nhật text_path trong DB nếu có text
+      - lưu vào data/text/<safe_id>.txt, set text_path nếu có text
     """
     pdf_path = item.get("pdf_path") or ""
     html_path = item.get("html_path") or ""
@@ -68,7 +72,6 @@ def extract_one(
     if not pdf_path and not html_path:
         return item  # không có gì để extract
 
-    os.makedirs(text_dir, exist_ok=True)
     safe_id = _safe_name(item["id"])
     out_path = os.path.join(text_dir, f"{safe_id}.txt")
 
@@ -85,15 +88,60 @@ def extract_one(
                 f.write(text)
             updated["text_path"] = out_path
             # có thể thêm vài thống kê cơ bản nếu muốn
-            meta = {}
-            try:
-                meta = json.loads(updated.get("meta_json") or "{}")
-            except Exception:
-                meta = {}
+            # loads_meta trả dict cache (read-only) — copy rồi mới gắn _extract
+            meta = dict(jsonio.loads_meta(updated.get("meta_json") or ""))
             meta["_extract"] = {"chars": len(text)}
-            updated["meta_json"] = json.dumps(meta, ensure_ascii=False)
-            db.upsert_item(updated)
+            updated["meta_json"] = jsonio.dumps(meta)
         except Exception:
             # nếu lưu file lỗi thì bỏ qua
             pass
     return updated
+
+
+def extract_one(
+    db: DB, item: dict, text_dir: str, max_pdf_pages: Optional[int] = None
+) -> dict:
+    """Extract 1 record và cập nhật DB nếu có text (caller chịu flush)."""
+    os.makedirs(text_dir, exist_ok=True)
+    updated = _extract_row(item, text_dir, max_pdf_pages=max_pdf_pages)
+    if (updated.get("text_path") or "") != (item.get("text_path") or ""):
+        db.upsert_item(updated)
+    return updated
+
+
+def extract_all(
+    db: DB,
+    text_dir: str,
+    limit: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    max_pdf_pages: Optional[int] = None,
+) -> dict:
+    """
+    Extract song song bằng process pool — PyMuPDF/trafilatura là CPU-bound
+    nên thread không giúp gì; worker chạy _extract_row thuần, process chính
+    gom kết quả và ghi DB 1 lượt. Trả về {"attempted", "ok"}.
+    """
+    os.makedirs(text_dir, exist_ok=True)
+    items = list(db.iter_needing_extract(limit))
+    stats = {"attempted": 0, "ok": 0}
+    if not items:
+        return stats
+
+    work = partial(_extract_row, text_dir=text_dir, max_pdf_pages=max_pdf_pages)
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) == 1:
+        results = map(work, items)
+        for updated in results:
+            stats["attempted"] += 1
+            if (updated.get("text_path") or "").strip():
+                stats["ok"] += 1
+                db.upsert_item(updated)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for updated in ex.map(work, items, chunksize=4):
+                stats["attempted"] += 1
+                if (updated.get("text_path") or "").strip():
+                    stats["ok"] += 1
+                    db.upsert_item(updated)
+    db.flush()
+    return stats
@@ -1,10 +1,10 @@
 from __future__ import annotations
-import json
 import math
 import re
-from typing import Iterable, Dict, Any, List
+from typing import Iterable, Dict, Any, List, Optional
 
 from ..logger import get_logger
+from ..utils import jsonio
 from .storage import DB
 
 
@@ -12,58 +12,54 @@ _WORD_SPLIT = re.compile(r"[^\w]+", re.UNICODE)
 
 
 def _normalize_kw(keywords: Iterable[str]) -> List[str]:
-    out = []
-    for k in keywords or []:
-        k = (k or "").strip().lower()
-        if not k:
-            continue
-        out.append(k)
-    # bỏ trùng, giữ thứ tự
-    seen = set()
-    uniq = []
-    for k in out:
-        if k in seen:
-            continue
-        seen.add(k)
-        uniq.append(k)
-    return uniq
-
-
-def _count_phrase(text: str, phrase: str) -> int:
-    """Đếm số lần xuất hiện của phrase (không phân biệt hoa/thường), match rời rạc theo word-boundary khi khả thi."""
-    if not text or not phrase:
+    # dict.fromkeys: strip/lower + bỏ trùng giữ thứ tự trong 1 pass
+    return list(
+        dict.fromkeys(k.strip().lower() for k in keywords or [] if k and k.strip())
+    )
+
+
+_SIMPLE_WORD = re.compile(r"^[\w\-]+$")
+
+
+def _build_matcher(keywords: List[str]):
+    """Gộp toàn bộ keyword (đã lowercase) vào 1 regex alternation, compile 1 lần.
+
+    Một lần quét đếm hit của mọi keyword — O(T) thay vì O(K·T) khi chạy
+    từng keyword một. Từ đơn giữ nguyên word-boundary như trước; phrase dài
+    xếp trước trong alternation để được ưu tiên match.
+    """
+    if not keywords:
+        return None
+    parts = []
+    for k in sorted(keywords, key=len, reverse=True):
+        esc = re.escape(k)
+        if _SIMPLE_WORD.match(k):
+            esc = rf"\b{esc}\b"
+        parts.append(esc)
+    return re.compile("|".join(parts))
+
+
+def _count_hits(matcher, text_l: str) -> int:
+    """Đếm tổng số match trong text ĐÃ lowercase (lowercase 1 lần ở caller)."""
+    if matcher is None or not text_l:
         return 0
-    text_l = text.lower()
-    ph_l = phrase.lower()
-    # nếu phrase là một từ đơn giản, dùng word boundary; còn lại dùng tìm substring thường
-    if re.match(r"^[\w\-]+$", ph_l):
-        pat = re.compile(rf"\b{re.escape(ph_l)}\b", flags=re.IGNORECASE)
-        return len(pat.findall(text_l))
-    return text_l.count(ph_l)
+    return sum(1 for _ in matcher.finditer(text_l))
 
 
 def _reconstruct_openalex_abstract(inv_index: Dict[str, List[int]] | None) -> str:
     """OpenAlex: abstract_inverted_index -> text. An toàn nếu không có."""
     if not inv_index:
         return ""
-    # lấy độ dài tối đa
-    max_pos = 0
-    for positions in inv_index.values():
-        if positions:
-            max_pos = max(max_pos, max(positions))
-    words = [""] * (max_pos + 1)
-    for word, positions in inv_index.items():
-        for p in positions or []:
-            if 0 <= p < len(words):
-                words[p] = word
-    return " ".join(w for w in words if w)
+    # 1 pass (position, word) + sort — không cần quét tìm max_pos trước
+    # rồi dựng list thưa có slot rỗng như bản cũ
+    pairs = [(p, w) for w, positions in inv_index.items() for p in positions or []]
+    pairs.sort()
+    return " ".join(w for _, w in pairs)
 
 
 def _extract_abstract_from_meta(meta_json: str) -> str:
-    try:
-        meta = json.loads(meta_json or "{}")
-    except Exception:
-        return ""
+    # loads_meta cache sẵn blob đã parse ở stage trước (fetch/extract)
+    meta = jsonio.loads_meta(meta_json or "")
     # OpenAlex có abstract_inverted_index
     if "abstract_inverted_index" in meta and isinstance(
         meta["abstract_inverted_index"], dict
@@ -87,25 +83,48 @@ def _read_text_file(path: str, max_chars: int = 200_000) -> str:
 
 
 def compute_score_for_row(
-    row: Dict[str, Any], keywords: List[str], cfg: Dict[str, Any]
+    row: Dict[str, Any],
+    keywords: List[str],
+    cfg: Dict[str, Any],
+    matcher=None,
+    text: Optional[str] = None,
 ) -> float:
-    """Tính điểm 0..1 dựa trên (title, abstract, text)."""
+    """Tính điểm 0..1 dựa trên (title, abstract, text).
+
+    matcher: regex gộp từ _build_matcher — truyền vào khi chấm theo batch
+    (score_db) để không build lại per-row.
+    text: nếu caller đã có sẵn text trong RAM (vd vừa extract xong) thì
+    truyền thẳng vào, khỏi đọc lại file .txt từ đĩa.
+    """
+    if matcher is None:
+        matcher = _build_matcher(keywords)
+
     title = (row.get("title") or "").strip()
     abstract = _extract_abstract_from_meta(row.get("meta_json") or "")
-    text = _read_text_file(
-        row.get("text_path") or "",
-        max_chars=int(cfg.get("scoring", {}).get("max_text_chars", 200_000)),
-    )
 
     w_title = float(cfg.get("scoring", {}).get("w_title", 3.0))
     w_abs = float(cfg.get("scoring", {}).get("w_abstract", 2.0))
     w_txt = float(cfg.get("scoring", {}).get("w_text", 1.0))
+    alpha = float(cfg.get("scoring", {}).get("alpha", 6.0))
+
+    hits_title = _count_hits(matcher, title.lower())
+    hits_abs = _count_hits(matcher, abstract.lower())
+    raw = w_title * hits_title + w_abs * hits_abs
 
-    hits_title = sum(_count_phrase(title, k) for k in keywords)
-    hits_abs = sum(_count_phrase(abstract, k) for k in keywords)
-    hits_txt = sum(_count_phrase(text, k) for k in keywords)
+    # 1-exp(-raw/alpha) bão hòa: raw >= 7*alpha thì base > 0.999 — đọc và
+    # quét thêm 200k chars text chỉ đổi score < 1e-3, không lật nổi quyết
+    # định keep, nên trả sớm luôn (bỏ cả lượt đọc file)
+    if text is None and raw >= 7.0 * alpha:
+        return min(1.0, 1.0 - math.exp(-raw / max(alpha, 1e-6)))
 
-    raw = w_title * hits_title + w_abs * hits_abs + w_txt * hits_txt
+    if text is None:
+        text = _read_text_file(
+            row.get("text_path") or "",
+            max_chars=int(cfg.get("scoring", {}).get("max_text_chars", 200_000)),
+        )
+
+    hits_txt = _count_hits(matcher, text.lower())
+    raw += w_txt * hits_txt
 
     # chất lượng tối thiểu theo độ dài text
     min_chars = int(cfg.get("scoring", {}).get("min_chars", 800))
@@ -117,7 +136,6 @@ def compute_score_for_row(
         )  # tăng dần tới trần
 
     # ánh xạ về [0,1]: 1 - exp(-raw/alpha)
-    alpha = float(cfg.get("scoring", {}).get("alpha", 6.0))
     base = 1.0 - math.exp(-raw / max(alpha, 1e-6))
     score = max(0.0, min(1.0, base + qbonus))
     return score
@@ -129,21 +147,25 @@ def score_db(db: DB, cfg: Dict[str, Any], log_level: str = "INFO") -> Dict[str,
     if not keywords:
         log.warning("No keywords in config.domain.keywords; scoring will be 0 for all.")
     threshold = float(cfg.get("scoring", {}).get("keep_threshold", 0.5))
+    matcher = _build_matcher(keywords)
 
     n_total = n_updated = n_kept = 0
     for row in db.iter_items():
         n_total += 1
-        score = compute_score_for_row(row, keywords, cfg)
+        score = compute_score_for_row(row, keywords, cfg, matcher=matcher)
         kept = 1 if score >= threshold else 0
         if abs(score - float(row.get("score") or 0.0)) > 1e-6 or kept != int(
             row.get("kept") or 0
         ):
-            row["score"] = float(score)
-            row["kept"] = kept
-            db.upsert_item(row)
+            # chỉ 2 cột đổi — UPDATE hẹp thay vì upsert nguyên row
+            db.update_score(row["id"], score, kept)
             n_updated += 1
             if kept:
                 n_kept += 1
+            # commit theo batch thay vì per-row (upsert_item không còn tự commit)
+            if n_updated % 500 == 0:
+                db.flush()
+    db.flush()
 
     log.info(
         "scoring finished: total=%d updated=%d kept>=%s = %d",
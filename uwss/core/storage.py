@@ -1,8 +1,11 @@
 import os
 import json
 import sqlite3
+import threading
 from typing import Dict, Any, Iterable, Optional
 
+# meta_json nằm ở bảng riêng: các hot loop quét items không phải kéo
+# blob metadata (có thể hàng chục KB) qua page cache cho từng row
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS items (
   id TEXT PRIMARY KEY,
@@ -15,11 +18,47 @@ CREATE TABLE IF NOT EXISTS items (
   html_path TEXT,
   text_path TEXT,
   score REAL,
-  kept INTEGER DEFAULT 0,
+  kept INTEGER DEFAULT 0
+);
+"""
+
+SCHEMA_META = """
+CREATE TABLE IF NOT EXISTS items_meta (
+  id TEXT PRIMARY KEY,
   meta_json TEXT
 );
 """
 
+# bộ cột chuẩn của items — thứ tự cố định để mọi upsert dùng chung
+# đúng 1 câu SQL (SQLite cache được prepared plan, không re-parse per call)
+COLUMNS = (
+    "id",
+    "title",
+    "year",
+    "venue",
+    "doi",
+    "source_url",
+    "pdf_path",
+    "html_path",
+    "text_path",
+    "score",
+    "kept",
+)
+_COLSET = frozenset(COLUMNS)
+
+_ITEM_UPSERT = (
+    f"INSERT INTO items ({','.join(COLUMNS)})"
+    f" VALUES ({','.join('?' * len(COLUMNS))})"
+    " ON CONFLICT(id) DO UPDATE SET "
+    + ",".join(f"{c}=excluded.{c}" for c in COLUMNS if c != "id")
+)
+
+# SELECT chung khi cần kèm meta
+_SELECT_WITH_META = (
+    "SELECT i.*, m.meta_json FROM items AS i"
+    " LEFT JOIN items_meta AS m ON m.id = i.id"
+)
+
 
 class DB:
     """SQLite wrapper cực gọn cho local. DSN dạng sqlite:///data/uwss.db"""
@@ -31,29 +70,268 @@ class DB:
         dir_ = os.path.dirname(path) or "."
         os.makedirs(dir_, exist_ok=True)
         self.path = path
-        self.conn = sqlite3.connect(path)
+        # check_same_thread=False: cho phép worker threads (cmd_fetch) ghi;
+        # mọi write đi qua self._lock nên vẫn an toàn
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # PRAGMA cho bulk write: WAL (persist trong file DB) + synchronous=NORMAL
+        # bỏ fsync-per-commit; temp/cache/mmap giảm IO khi quét bảng lớn
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("PRAGMA cache_size=-65536")
         self.conn.execute(SCHEMA)
+        self.conn.execute(SCHEMA_META)
+        self._migrate_meta_column()
+        # partial index khớp đúng predicate của iter_needing_fetch/extract —
+        # rất nhỏ (chỉ chứa row chưa xử lý) và giúp query todo scale theo backlog.
+        # IFNULL: schema cho phép path NULL (row chèn thiếu cột) — NULL cũng là
+        # "chưa có file", không được để kẹt ngoài todo
+        self._ensure_index(
+            "ix_items_fetch_todo",
+            "CREATE INDEX IF NOT EXISTS ix_items_fetch_todo ON items(id)"
+            " WHERE IFNULL(pdf_path,'')='' AND IFNULL(html_path,'')=''",
+        )
+        self._ensure_index(
+            "ix_items_extract_todo",
+            "CREATE INDEX IF NOT EXISTS ix_items_extract_todo ON items(id)"
+            " WHERE (IFNULL(pdf_path,'')!='' OR IFNULL(html_path,'')!='')"
+            " AND IFNULL(text_path,'')=''",
+        )
+        # cho các filter/sort kept=1 + score (export --only-kept, xếp hạng)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_items_kept_score ON items(kept, score)"
+        )
         self.conn.commit()
 
-    def upsert_item(self, row: Dict[str, Any]) -> None:
-        cols = list(row.keys())
-        placeholders = ":" + ",:".join(cols)
-        sql = f"INSERT OR REPLACE INTO items ({','.join(cols)}) VALUES ({placeholders})"
-        self.conn.execute(sql, row)
+    def _ensure_index(self, name: str, create_sql: str) -> None:
+        """Tạo index; nếu DB cũ có bản cùng tên nhưng định nghĩa khác
+        (vd predicate chưa IFNULL) thì drop và tạo lại."""
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND name=?", (name,)
+        ).fetchone()
+        # sqlite_master lưu SQL đã bỏ "IF NOT EXISTS" — so sánh dạng đã bỏ
+        wanted = create_sql.replace("IF NOT EXISTS ", "")
+        if row and (row[0] or "") != wanted:
+            self.conn.execute(f"DROP INDEX {name}")
+        self.conn.execute(create_sql)
+
+    def _migrate_meta_column(self) -> None:
+        """DB cũ còn cột items.meta_json: chuyển dữ liệu sang items_meta."""
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(items)")}
+        if "meta_json" not in cols:
+            return
+        self.conn.execute(
+            "INSERT OR IGNORE INTO items_meta(id, meta_json)"
+            " SELECT id, meta_json FROM items WHERE meta_json IS NOT NULL"
+        )
+        try:
+            self.conn.execute("ALTER TABLE items DROP COLUMN meta_json")
+        except sqlite3.OperationalError:
+            pass  # sqlite < 3.35: cột cũ nằm lại cũng vô hại, code không đọc nữa
         self.conn.commit()
 
+    @staticmethod
+    def _split_meta(row: Dict[str, Any]):
+        """Tách meta_json khỏi row items (không sửa dict của caller)."""
+        if "meta_json" not in row:
+            return row, None
+        item = {k: v for k, v in row.items() if k != "meta_json"}
+        return item, row["meta_json"]
+
+    _META_UPSERT = (
+        "INSERT INTO items_meta (id, meta_json) VALUES (?, ?)"
+        " ON CONFLICT(id) DO UPDATE SET meta_json=excluded.meta_json"
+    )
+
+    def upsert_item(self, row: Dict[str, Any]) -> None:
+        """Ghi 1 row. KHÔNG commit — caller gọi flush() theo batch/cuối loop.
+        commit-per-row nghĩa là fsync-per-row, chính nó là bottleneck
+        của score/extract."""
+        item, meta = self._split_meta(row)
+        if set(item) == _COLSET:
+            sql = _ITEM_UPSERT
+            args: Any = tuple(item[c] for c in COLUMNS)
+        else:
+            # row thiếu/thừa cột (hiếm) — build SQL theo keys như trước
+            cols = list(item.keys())
+            placeholders = ":" + ",:".join(cols)
+            sql = f"INSERT OR REPLACE INTO items ({','.join(cols)}) VALUES ({placeholders})"
+            args = item
+        with self._lock:
+            self.conn.execute(sql, args)
+            if meta is not None:
+                self.conn.execute(self._META_UPSERT, (item["id"], meta))
+
+    def flush(self) -> None:
+        """Commit các write đang pending (sau 1 batch upsert_item)."""
+        with self._lock:
+            self.conn.commit()
+
+    def __enter__(self) -> "DB":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def upsert_many(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Upsert nhiều row đủ schema chuẩn trong 1 transaction (executemany)."""
+        rows = list(rows)
+        if not rows:
+            return
+        # tuple positional theo COLUMNS: 1 prepared statement cho cả batch,
+        # ON CONFLICT DO UPDATE update tại chỗ thay vì REPLACE (delete+insert)
+        item_rows = []
+        meta_rows = []
+        for r in rows:
+            item, meta = self._split_meta(r)
+            item_rows.append(tuple(item.get(c) for c in COLUMNS))
+            if meta is not None:
+                meta_rows.append((item["id"], meta))
+        with self._lock, self.conn:
+            self.conn.executemany(_ITEM_UPSERT, item_rows)
+            if meta_rows:
+                self.conn.executemany(self._META_UPSERT, meta_rows)
+
+    def update_score(self, id_: str, score: float, kept: int) -> None:
+        """UPDATE hẹp cho vòng chấm điểm — không rewrite cả row (blob meta
+        nằm bảng khác nhưng REPLACE vẫn chép lại mọi cột). Không commit,
+        caller flush() theo batch."""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE items SET score=?, kept=? WHERE id=?",
+                (float(score), int(kept), id_),
+            )
+
     def get_item(self, id_: str) -> Optional[Dict[str, Any]]:
-        cur = self.conn.execute("SELECT * FROM items WHERE id=?", (id_,))
+        cur = self.conn.execute(_SELECT_WITH_META + " WHERE i.id=?", (id_,))
         one = cur.fetchone()
         if not one:
             return None
         cols = [c[0] for c in cur.description]
         return dict(zip(cols, one))
 
-    def iter_items(self) -> Iterable[Dict[str, Any]]:
-        cur = self.conn.execute("SELECT * FROM items ORDER BY rowid DESC")
+    def iter_items(
+        self, with_meta: bool = True, columns: Optional[Iterable[str]] = None
+    ) -> Iterable[Dict[str, Any]]:
+        """columns: chỉ SELECT các cột cần — consumer không kéo blob meta_json
+        (hàng chục KB/row) hay path không dùng qua wire."""
+        if columns:
+            cols_req = list(columns)
+            if "meta_json" in cols_req:
+                proj = ",".join(
+                    "m.meta_json" if c == "meta_json" else f"i.{c}" for c in cols_req
+                )
+                sql = (
+                    f"SELECT {proj} FROM items AS i"
+                    " LEFT JOIN items_meta AS m ON m.id = i.id"
+                    " ORDER BY i.rowid DESC"
+                )
+            else:
+                sql = f"SELECT {','.join(cols_req)} FROM items ORDER BY rowid DESC"
+        elif with_meta:
+            sql = _SELECT_WITH_META + " ORDER BY i.rowid DESC"
+        else:
+            sql = "SELECT * FROM items ORDER BY rowid DESC"
+        cur = self.conn.execute(sql)
+        cur.arraysize = 1000
+        cols = [c[0] for c in cur.description]
+        # iterate cursor trực tiếp — không fetchall cả bảng vào RAM
+        for r in cur:
+            yield dict(zip(cols, r))
+
+    def iter_export_rows(
+        self, only_kept: bool = False, only_with_files: bool = False
+    ) -> Iterable[Dict[str, Any]]:
+        """Rows cho export — predicate đẩy xuống SQL thay vì lọc Python.
+        Kèm meta_json: artifact export phải đủ metadata (DOI, abstract...)."""
+        conds = []
+        if only_kept:
+            conds.append("i.kept=1")
+        if only_with_files:
+            conds.append("(i.pdf_path!='' OR i.html_path!='')")
+        sql = _SELECT_WITH_META
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        sql += " ORDER BY i.rowid DESC"
+        cur = self.conn.execute(sql)
+        cur.arraysize = 1000
+        cols = [c[0] for c in cur.description]
+        for r in cur:
+            yield dict(zip(cols, r))
+
+    def known_ids(self) -> set:
+        """Tập id đã có trong DB — dùng để skip sớm khi re-discover."""
+        cur = self.conn.execute("SELECT id FROM items")
+        return {r[0] for r in cur.fetchall()}
+
+    def peek(self, limit: int = 3) -> list:
+        """Vài row đầu cho db-peek: LIMIT + projection trong SQL, bỏ qua meta_json."""
+        cur = self.conn.execute(
+            "SELECT id, title, year, doi, score, kept FROM items"
+            " ORDER BY rowid DESC LIMIT ?",
+            (int(limit),),
+        )
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def stats(self) -> Dict[str, int]:
+        """Thống kê trong 1 câu aggregate — mọi thứ chạy trong SQLite VM (C)."""
+        cur = self.conn.execute(
+            "SELECT COUNT(*),"
+            " COALESCE(SUM(pdf_path!=''),0),"
+            " COALESCE(SUM(html_path!=''),0),"
+            " COALESCE(SUM(text_path!=''),0),"
+            " COALESCE(SUM(kept=1),0)"
+            " FROM items"
+        )
+        total, pdf, html, text, kept = cur.fetchone()
+        return {
+            "total": total,
+            "with_pdf": pdf,
+            "with_html": html,
+            "with_text": text,
+            "kept": kept,
+        }
+
+    def iter_needing_fetch(
+        self, limit: Optional[int] = None
+    ) -> Iterable[Dict[str, Any]]:
+        """Các row chưa có pdf/html — filter trong SQL thay vì quét Python.
+        Kèm meta (fetch_one cần locations/doi)."""
+        sql = (
+            _SELECT_WITH_META
+            + " WHERE IFNULL(i.pdf_path,'')='' AND IFNULL(i.html_path,'')=''"
+            " ORDER BY i.rowid DESC"
+        )
+        args: tuple = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            args = (int(limit),)
+        cur = self.conn.execute(sql, args)
+        cols = [c[0] for c in cur.description]
+        for r in cur:
+            yield dict(zip(cols, r))
+
+    def iter_needing_extract(
+        self, limit: Optional[int] = None
+    ) -> Iterable[Dict[str, Any]]:
+        """Các row có file gốc nhưng chưa có text.
+        Kèm meta vì extract_one ghi thống kê _extract vào đó."""
+        sql = (
+            _SELECT_WITH_META
+            + " WHERE (IFNULL(i.pdf_path,'')!='' OR IFNULL(i.html_path,'')!='')"
+            " AND IFNULL(i.text_path,'')='' ORDER BY i.rowid DESC"
+        )
+        args: tuple = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            args = (int(limit),)
+        cur = self.conn.execute(sql, args)
         cols = [c[0] for c in cur.description]
-        for r in cur.fetchall():
+        for r in cur:
             yield dict(zip(cols, r))
 
 
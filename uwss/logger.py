@@ -1,27 +1,41 @@
 import logging
 import os
 
+_LOG_FILE = "data/logs/uwss.log"
+_configured = False
 
-def get_logger(name: str, level: str = "INFO") -> logging.Logger:
-    os.makedirs("data/logs", exist_ok=True)
-    log_file = "data/logs/uwss.log"
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+def configure_logging(log_file: str = _LOG_FILE) -> None:
+    """Gắn handler 1 lần lên logger cha "uwss" — gọi từ CLI entry.
+
+    Các logger con (uwss.fetch, uwss.score, ...) propagate lên đây, nên
+    get_logger sau đó chỉ còn là lookup trong registry của logging,
+    không makedirs/dựng Formatter lại mỗi lần.
+    """
+    global _configured
+    if _configured:
+        return
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
 
-    # tránh nhân đôi handler khi gọi nhiều lần
-    if not logger.handlers:
-        fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    # delay=True: chưa mở file cho tới record đầu tiên —
+    # process/worker không log gì thì không tạo FD
+    fh = logging.FileHandler(log_file, encoding="utf-8", delay=True)
+    fh.setFormatter(fmt)
 
-        fh = logging.FileHandler(log_file, encoding="utf-8")
-        fh.setFormatter(fmt)
-        fh.setLevel(level)
+    ch = logging.StreamHandler()
+    ch.setFormatter(fmt)
 
-        ch = logging.StreamHandler()
-        ch.setFormatter(fmt)
-        ch.setLevel(level)
+    parent = logging.getLogger("uwss")
+    parent.addHandler(fh)
+    parent.addHandler(ch)
+    _configured = True
 
-        logger.addHandler(fh)
-        logger.addHandler(ch)
 
+def get_logger(name: str, level: str = "INFO") -> logging.Logger:
+    if not _configured:
+        # dùng module lẻ ngoài CLI (import trực tiếp) vẫn có log
+        configure_logging()
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
     return logger
@@ -39,4 +39,15 @@ def normalize_locations(locs: Iterable[Dict[str, Any] | Location]) -> List[Locat
         out.append(loc)
     # sort theo priority
     out.sort(key=lambda z: z.priority)
-    return out
+    # khử trùng lặp URL (OpenAlex + Unpaywall hay trả cùng pdf_url):
+    # đã sort nên bản priority tốt nhất được giữ, các bản sau bị bỏ —
+    # fetch_one không retry cùng 1 URL hỏng nhiều lần nữa
+    seen: set = set()
+    uniq: List[Location] = []
+    for loc in out:
+        key = (loc.pdf_url or "", loc.html_url or "")
+        if key in seen:
+            continue
+        seen.add(key)
+        uniq.append(loc)
+    return uniq
@@ -0,0 +1,51 @@
+# uwss/utils/jsonio.py
+"""JSON nhanh cho các hot path: dùng orjson (C/SIMD) nếu có, fallback stdlib."""
+from __future__ import annotations
+
+import functools
+import json as _json
+from typing import Any, Dict
+
+try:
+    import orjson as _orjson
+except ImportError:  # orjson là optional — stdlib vẫn chạy đúng
+    _orjson = None
+
+
+if _orjson is not None:
+
+    def dumps(obj: Any) -> str:
+        return _orjson.dumps(obj).decode("utf-8")
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return _orjson.dumps(obj)
+
+    def loads(s: str | bytes) -> Any:
+        return _orjson.loads(s)
+
+else:
+
+    def dumps(obj: Any) -> str:
+        return _json.dumps(obj, ensure_ascii=False)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return _json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def loads(s: str | bytes) -> Any:
+        return _json.loads(s)
+
+
+@functools.lru_cache(maxsize=256)
+def loads_meta(s: str) -> Dict[str, Any]:
+    """Parse meta_json có cache — cùng 1 blob hay bị parse lại ở nhiều stage
+    (fetch → abstract → extract). Lỗi parse trả {} thay vì raise.
+
+    LƯU Ý: dict trả về nằm trong cache, caller chỉ được ĐỌC;
+    muốn sửa thì copy trước (dict(...)).
+    """
+    if not s:
+        return {}
+    try:
+        return loads(s)
+    except Exception:
+        return {}